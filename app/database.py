@@ -12,6 +12,21 @@ class Settings(BaseSettings):
     DB_NAME: str
     JWT_SECRET_KEY: str
     JWT_REFRESH_SECRET_KEY: str
+    STATS_RECONCILE_INTERVAL_SECONDS: int = 60 * 60
+    REVOKED_TOKENS_SYNC_INTERVAL_SECONDS: int = 60
+    PROFILING_ENABLED: bool = False
+    PROFILING_TOKEN: str = ""
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_OUTPUT_DIR: str = "profiles"
+    PROFILING_MAX_FILES: int = 100
+    CALENDAR_MAX_ORGANIZATIONS: int = 20
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_PER_MINUTE: int = 60
+    RATE_LIMIT_ROUTES: dict[str, int] = {}
+    RATE_LIMIT_REDIS_URL: str = ""
+    RATE_LIMIT_CLIENT_HEADER: str = ""
+    CONCURRENCY_LIMIT: int = 8
+    CONCURRENCY_RETRY_AFTER_SECONDS: int = 1
     model_config = SettingsConfigDict(env_file=".env")
 
 
@@ -1,16 +1,22 @@
-from fastapi import Depends, HTTPException, status
+import math
+
+from fastapi import Depends, HTTPException, Request, status
 
 from .database import get_db
 from .database import SessionLocal
+from .database import settings
 from fastapi.security import OAuth2PasswordBearer
 from .utils.auth import (
     ALGORITHM,
-    JWT_SECRET_KEY
+    JWT_SECRET_KEY,
+    JWT_REFRESH_SECRET_KEY
 )
+from .utils.ratelimit import get_concurrency_limiter, take_token
+from .utils.revocation import revoked_tokens
 
 from jose import jwt, JWTError
 from pydantic import ValidationError
-from .schemas import TokenSerializer, TokenPayloadSerializer
+from .schemas import TokenSerializer, TokenPayloadSerializer, RefreshTokenSerializer
 from datetime import datetime
 from .models import User
 from sqlalchemy.orm import Session
@@ -40,3 +46,82 @@ async def get_current_user(token: str = Depends(reuseable_oauth), db: Session =
 
     user = db.query(User).filter(User.username == token_data.sub).first()
     return user
+
+
+def get_refresh_token_payload(data: RefreshTokenSerializer) -> TokenPayloadSerializer:
+    try:
+        payload = jwt.decode(
+            data.refresh_token, JWT_REFRESH_SECRET_KEY, algorithms=[ALGORITHM]
+        )
+        token_data = TokenPayloadSerializer(**payload)
+    except(JWTError, ValidationError):
+        token_data = None
+
+    if token_data is None or token_data.jti is None or token_data.jti in revoked_tokens:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return token_data
+
+
+def _check_rate_limit(route: str, key: str):
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    retry_after = take_token(route, key)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+def rate_limit(route: str):
+    """Token bucket per authenticated user for the given route."""
+
+    def dependency(user: User = Depends(get_current_user)):
+        _check_rate_limit(route, "user:{}".format(user.id))
+
+    return dependency
+
+
+def get_client_address(request: Request) -> str:
+    """
+    Client address for rate limiting. Behind a reverse proxy, RATE_LIMIT_CLIENT_HEADER names the header
+    the proxy sets; for lists such as X-Forwarded-For the last entry, appended by the proxy, is used.
+    """
+    if settings.RATE_LIMIT_CLIENT_HEADER:
+        forwarded = request.headers.get(settings.RATE_LIMIT_CLIENT_HEADER)
+        if forwarded:
+            return forwarded.split(",")[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def rate_limit_client(route: str):
+    """Token bucket per client address, for routes called before authentication."""
+
+    def dependency(request: Request):
+        _check_rate_limit(route, "client:{}".format(get_client_address(request)))
+
+    return dependency
+
+
+def limit_concurrency(name: str):
+    """Reject requests with 503 once CONCURRENCY_LIMIT requests of this kind are in flight."""
+
+    def dependency():
+        limiter = get_concurrency_limiter(name)
+        if not limiter.acquire(settings.CONCURRENCY_LIMIT):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, try again later",
+                headers={"Retry-After": str(settings.CONCURRENCY_RETRY_AFTER_SECONDS)},
+            )
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    return dependency
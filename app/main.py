@@ -1,9 +1,72 @@
+import asyncio
+import logging
+
 from fastapi import FastAPI
+from starlette.concurrency import run_in_threadpool
+
+from .database import SessionLocal, engine, settings
+from .routers import appointments, organizations, profiles, users
+from .utils.profiling import profile_request
+from .utils.revocation import revoked_tokens
+from .utils.stats import ReconciliationLeader, reconcile_all_stats
 
-from .routers import appointments, organizations, users
+logger = logging.getLogger(__name__)
+
+stats_leader = ReconciliationLeader(engine)
 
 app = FastAPI()
 app.include_router(appointments.router)
 app.include_router(organizations.router)
 app.include_router(users.router)
 
+if settings.PROFILING_ENABLED:
+    app.middleware("http")(profile_request)
+    app.include_router(profiles.router)
+
+
+def _with_session(func):
+    db = SessionLocal()
+    try:
+        func(db)
+    finally:
+        db.close()
+
+
+async def _run_periodically(func, interval: int):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(_with_session, func)
+        except Exception:
+            logger.exception("Periodic task %s failed", func.__qualname__)
+
+
+def _reconcile_stats_if_leader():
+    if stats_leader.acquire():
+        _with_session(reconcile_all_stats)
+
+
+async def _reconcile_stats():
+    # The first pass backfills existing appointments; later passes correct drift
+    while True:
+        try:
+            await run_in_threadpool(_reconcile_stats_if_leader)
+        except Exception:
+            logger.exception("Stats reconciliation failed")
+        if settings.STATS_RECONCILE_INTERVAL_SECONDS <= 0:
+            return
+        await asyncio.sleep(settings.STATS_RECONCILE_INTERVAL_SECONDS)
+
+
+@app.on_event("startup")
+async def start_stats_reconciliation():
+    app.state.stats_reconciliation = asyncio.create_task(_reconcile_stats())
+
+
+@app.on_event("startup")
+async def start_revoked_tokens_sync():
+    await run_in_threadpool(_with_session, revoked_tokens.sync)
+    if settings.REVOKED_TOKENS_SYNC_INTERVAL_SECONDS > 0:
+        app.state.revoked_tokens_sync = asyncio.create_task(
+            _run_periodically(revoked_tokens.sync, settings.REVOKED_TOKENS_SYNC_INTERVAL_SECONDS)
+        )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, DateTime, Integer, ForeignKey, String
+from sqlalchemy import Column, Date, DateTime, Index, Integer, ForeignKey, String, UniqueConstraint
 from sqlalchemy.orm import relationship, declarative_base
 from datetime import datetime
 
@@ -30,6 +30,7 @@ class AppointmentVersion(Base):
 
 class Appointment(Base):
     __tablename__ = "appointments"
+    __table_args__ = (Index("ix_appointments_organization_id_start", "organization_id", "start"),)
 
     id = Column(Integer, primary_key=True)
     start = Column(DateTime, nullable=False)
@@ -56,3 +57,35 @@ class User(Base):
 
     def __repr__(self):
         return f"<User {self.username}>"
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    id = Column(Integer, primary_key=True)
+    jti = Column(String, nullable=False, unique=True, index=True)
+    expires_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class OrganizationDailyStats(Base):
+    __tablename__ = "organization_daily_stats"
+    __table_args__ = (UniqueConstraint("organization_id", "day"),)
+
+    id = Column(Integer, primary_key=True)
+    organization_id = Column(Integer, ForeignKey("organizations.id", ondelete="CASCADE"), nullable=False, index=True)
+    day = Column(Date, nullable=False)
+    booked_minutes = Column(Integer, nullable=False, default=0)
+    appointment_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class OrganizationHourlyStats(Base):
+    __tablename__ = "organization_hourly_stats"
+    __table_args__ = (UniqueConstraint("organization_id", "day", "hour"),)
+
+    id = Column(Integer, primary_key=True)
+    organization_id = Column(Integer, ForeignKey("organizations.id", ondelete="CASCADE"), nullable=False, index=True)
+    day = Column(Date, nullable=False)
+    hour = Column(Integer, nullable=False)
+    booked_minutes = Column(Integer, nullable=False, default=0)
@@ -3,10 +3,12 @@ import datetime
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from starlette import status
+from starlette.concurrency import run_in_threadpool
 
-from ..dependencies import get_current_db, get_current_user
+from ..dependencies import get_current_db, get_current_user, limit_concurrency, rate_limit
 from ..models import Appointment, AppointmentVersion, User
 from ..schemas import AppointmentCreateSerializer, AppointmentSerializer
+from ..utils.stats import apply_appointment
 
 router = APIRouter(
     prefix="/appointments",
@@ -30,15 +32,17 @@ def check_appointment_valid(appointment: AppointmentCreateSerializer, db: Sessio
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Appointment already exists")
 
 
-@router.post("/", response_model=AppointmentSerializer)
+@router.post("/", response_model=AppointmentSerializer,
+             dependencies=[Depends(rate_limit("create_appointment")), Depends(limit_concurrency("conflict_check"))])
 async def create_appointment(appointment: AppointmentCreateSerializer, db: Session = Depends(get_current_db),
                              user=Depends(get_current_user)):
-    check_appointment_valid(appointment, db)
+    await run_in_threadpool(check_appointment_valid, appointment, db)
 
     # Validate appointment data
     appointment_model = Appointment(**appointment.model_dump(), created_at=datetime.datetime.now(),
                                     updated_at=datetime.datetime.now(), user_id=user.id)
     db.add(appointment_model)
+    apply_appointment(db, appointment_model)
     db.commit()
     db.refresh(appointment_model)  # Reload latest data from database
     return appointment_model
@@ -61,27 +65,32 @@ async def read_appointment(appointment_id: int, db: Session = Depends(get_curren
     return appointment
 
 
-@router.put("/{appointment_id}", response_model=AppointmentSerializer)
+@router.put("/{appointment_id}", response_model=AppointmentSerializer,
+            dependencies=[Depends(rate_limit("update_appointment")), Depends(limit_concurrency("conflict_check"))])
 async def update_appointment(appointment_id: int, appointment: AppointmentCreateSerializer,
                              db: Session = Depends(get_current_db), user: User = Depends(get_current_user)):
     # Check if appointment exists
     existing_appointment = db.query(Appointment).filter(
         (Appointment.id == appointment_id) & (Appointment.user_id == user.id)).first()
-    check_appointment_valid(appointment, db)
+    await run_in_threadpool(check_appointment_valid, appointment, db)
     if existing_appointment is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Appointment not found")
     appointment_version = AppointmentVersion(appointment_id=appointment_id, start=existing_appointment.start,
                                              end=existing_appointment.end, created_at=datetime.datetime.now())
+    apply_appointment(db, existing_appointment, sign=-1)
     # Update appointment data
-    appointment_model = Appointment(**appointment.model_dump(), updated_at=datetime.datetime.now())
-    db.add(appointment_model)
+    for field, value in appointment.model_dump().items():
+        setattr(existing_appointment, field, value)
+    existing_appointment.updated_at = datetime.datetime.now()
+    apply_appointment(db, existing_appointment)
     db.add(appointment_version)
     db.commit()
-    db.refresh(appointment_model)
-    return appointment_model
+    db.refresh(existing_appointment)
+    return existing_appointment
 
 
-@router.delete("/{appointment_id}", response_model=AppointmentSerializer)
+@router.delete("/{appointment_id}", response_model=AppointmentSerializer,
+               dependencies=[Depends(rate_limit("delete_appointment"))])
 async def delete_appointment(appointment_id: int, db: Session = Depends(get_current_db),
                              user: User = Depends(get_current_user)):
     # Check if appointment exists
@@ -91,6 +100,7 @@ async def delete_appointment(appointment_id: int, db: Session = Depends(get_curr
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Appointment not found")
 
     # Delete appointment
+    apply_appointment(db, existing_appointment, sign=-1)
     db.delete(existing_appointment)
     db.commit()
     return existing_appointment
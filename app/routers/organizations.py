@@ -1,11 +1,22 @@
 import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from ..dependencies import get_current_db, get_current_user
+from ..database import settings
+from ..dependencies import get_current_db, get_current_user, limit_concurrency, rate_limit
 from ..models import Organization
-from ..schemas import OrganizationSerializer, OrganizationCreateSerializer, OrganizationUpdateSerializer
+from ..schemas import (
+    OrganizationSerializer,
+    OrganizationCreateSerializer,
+    OrganizationUpdateSerializer,
+    OrganizationDailyStatsSerializer,
+    CalendarAppointmentSerializer,
+    CalendarFreeSlotSerializer,
+)
+from ..utils.calendar import iter_calendar, to_naive_utc
+from ..utils.stats import delete_organization_stats, get_organization_stats, reconcile_organization_stats
 
 router = APIRouter(
     prefix="/organizations",
@@ -33,6 +44,34 @@ async def read_organizations(skip: int = 0, limit: int = 10, db: Session = Depen
     return organizations
 
 
+@router.get("/calendar", dependencies=[Depends(rate_limit("read_calendar")), Depends(limit_concurrency("export"))])
+async def read_calendar(start: datetime.datetime, end: datetime.datetime,
+                        organization_ids: list[int] = Query(...), free_time: bool = False,
+                        db: Session = Depends(get_current_db), user=Depends(get_current_user)):
+    """Stream appointments of several organizations merged by start time as newline-delimited JSON."""
+    start, end = to_naive_utc(start), to_naive_utc(end)
+    if end <= start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="End time must be after start time")
+    organization_ids = list(dict.fromkeys(organization_ids))
+    if len(organization_ids) > settings.CALENDAR_MAX_ORGANIZATIONS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="At most {} organizations can be merged".format(settings.CALENDAR_MAX_ORGANIZATIONS))
+    organizations_count = db.query(Organization).filter(
+        Organization.id.in_(organization_ids) & (Organization.user_id == user.id)).count()
+    if organizations_count != len(organization_ids):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Organization not found")
+
+    def serialize():
+        for entry in iter_calendar(db, organization_ids, start, end, free_time):
+            if entry[0] == "appointment":
+                item = CalendarAppointmentSerializer.model_validate(entry[1], from_attributes=True)
+            else:
+                item = CalendarFreeSlotSerializer(start=entry[1], end=entry[2])
+            yield item.model_dump_json() + "\n"
+
+    return StreamingResponse(serialize(), media_type="application/x-ndjson")
+
+
 @router.get("/{organization_id}")
 async def read_organization(organization_id: int, db: Session = Depends(get_current_db),
                             user=Depends(get_current_user)):
@@ -70,6 +109,7 @@ async def delete_organization(organization_id: int, db: Session = Depends(get_cu
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Organization not found")
 
     # Delete organization
+    delete_organization_stats(db, organization_id)
     db.delete(existing_organization)
     db.commit()
     return existing_organization
@@ -83,3 +123,28 @@ async def read_organization_appointments(organization_id: int, db: Session = Dep
     if organization is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Organization not found")
     return organization.appointments
+
+
+@router.get("/{organization_id}/stats", response_model=list[OrganizationDailyStatsSerializer],
+            dependencies=[Depends(rate_limit("read_organization_stats"))])
+async def read_organization_stats(organization_id: int, start: datetime.date, end: datetime.date,
+                                  db: Session = Depends(get_current_db), user=Depends(get_current_user)):
+    organization = db.query(Organization).filter(
+        (Organization.id == organization_id) & (Organization.user_id == user.id)).first()
+    if organization is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Organization not found")
+    if end < start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="End date must not be before start date")
+    return get_organization_stats(db, organization_id, start, end)
+
+
+@router.post("/{organization_id}/stats/reconcile", response_model=list[OrganizationDailyStatsSerializer],
+             dependencies=[Depends(rate_limit("reconcile_stats")), Depends(limit_concurrency("export"))])
+async def reconcile_stats(organization_id: int, start: datetime.date, end: datetime.date,
+                          db: Session = Depends(get_current_db), user=Depends(get_current_user)):
+    organization = db.query(Organization).filter(
+        (Organization.id == organization_id) & (Organization.user_id == user.id)).first()
+    if organization is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Organization not found")
+    reconcile_organization_stats(db, organization_id)
+    return get_organization_stats(db, organization_id, start, end)
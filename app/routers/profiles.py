@@ -0,0 +1,41 @@
+import datetime
+import os
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import FileResponse
+
+from ..database import settings
+from ..utils.profiling import is_authorized, list_profiles
+
+
+def require_profiling_token(x_profile_token: str = Header(None)):
+    if not is_authorized(x_profile_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid profiling token")
+
+
+router = APIRouter(
+    prefix="/profiles",
+    tags=["profiles"],
+    responses={404: {"description": "Not found"}},
+    dependencies=[Depends(require_profiling_token)],
+)
+
+
+@router.get("/")
+async def read_profiles():
+    profiles = []
+    for name in list_profiles():
+        stat = os.stat(os.path.join(settings.PROFILING_OUTPUT_DIR, name))
+        profiles.append({
+            "name": name,
+            "size": stat.st_size,
+            "created_at": datetime.datetime.fromtimestamp(stat.st_mtime),
+        })
+    return profiles
+
+
+@router.get("/{name}")
+async def read_profile(name: str):
+    if name not in list_profiles():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return FileResponse(os.path.join(settings.PROFILING_OUTPUT_DIR, name))
@@ -1,11 +1,27 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from ..dependencies import get_current_db, get_current_user
+from ..dependencies import (
+    get_current_db,
+    get_current_user,
+    get_refresh_token_payload,
+    limit_concurrency,
+    rate_limit_client,
+)
 from ..models import User
-from ..schemas import UserAuthSerializer, UserOutSerializer, TokenSerializer, UserLoginSerializer
+from ..schemas import (
+    UserAuthSerializer,
+    UserOutSerializer,
+    TokenSerializer,
+    UserLoginSerializer,
+    TokenPayloadSerializer,
+    RefreshTokenSerializer,
+)
 from ..utils.auth import create_access_token, create_refresh_token, verify_password, get_hashed_password
+from ..utils.revocation import revoked_tokens
+from datetime import datetime
 import uuid
 from fastapi import Depends
 from fastapi.security import OAuth2PasswordRequestForm
+from starlette.concurrency import run_in_threadpool
 from typing_extensions import Annotated
 
 
@@ -16,12 +32,13 @@ router = APIRouter(
 )
 
 
-@router.post('/signup', summary="Create new user", response_model=UserOutSerializer)
+@router.post('/signup', summary="Create new user", response_model=UserOutSerializer,
+             dependencies=[Depends(rate_limit_client("signup")), Depends(limit_concurrency("bcrypt"))])
 async def create_user(data: UserAuthSerializer, db=Depends(get_current_db)):
     user = User(
         username=data.username,
         email=data.email,
-        password=get_hashed_password(data.password),
+        password=await run_in_threadpool(get_hashed_password, data.password),
     )
     db.add(user)
     db.commit()
@@ -29,12 +46,13 @@ async def create_user(data: UserAuthSerializer, db=Depends(get_current_db)):
     return user
 
 
-@router.post('/login', summary="Login user", response_model=TokenSerializer)
+@router.post('/login', summary="Login user", response_model=TokenSerializer,
+             dependencies=[Depends(rate_limit_client("login")), Depends(limit_concurrency("bcrypt"))])
 async def login_user(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db=Depends(get_current_db)):
     user = db.query(User).filter(User.username == form_data.username).first()
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    if not verify_password(form_data.password, user.password):
+    if not await run_in_threadpool(verify_password, form_data.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     access_token = create_access_token(form_data.username)
     refresh_token = create_refresh_token(form_data.username)
@@ -44,6 +62,23 @@ async def login_user(form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
     }
 
 
+@router.post('/refresh', summary="Refresh access token", response_model=TokenSerializer,
+             dependencies=[Depends(rate_limit_client("refresh"))])
+async def refresh_token(data: RefreshTokenSerializer,
+                        token_data: TokenPayloadSerializer = Depends(get_refresh_token_payload)):
+    return {
+        "access_token": create_access_token(token_data.sub),
+        "refresh_token": data.refresh_token
+    }
+
+
+@router.post('/logout', summary="Revoke refresh token")
+async def logout_user(token_data: TokenPayloadSerializer = Depends(get_refresh_token_payload),
+                      db=Depends(get_current_db)):
+    await run_in_threadpool(revoked_tokens.revoke, db, token_data.jti, datetime.utcfromtimestamp(token_data.exp))
+    return {"detail": "Refresh token revoked"}
+
+
 @router.get('/me', summary="Get current user", response_model=UserOutSerializer)
 async def get_current_user(current_user: User = Depends(get_current_user)):
     return current_user
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, validator
-from typing import List
+from typing import List, Literal
 import datetime
 
 
@@ -42,6 +42,16 @@ class AppointmentSerializer(BaseModel):
     updated_at: datetime.datetime | None
 
 
+class CalendarAppointmentSerializer(AppointmentSerializer):
+    type: Literal["appointment"] = "appointment"
+
+
+class CalendarFreeSlotSerializer(BaseModel):
+    type: Literal["free"] = "free"
+    start: datetime.datetime
+    end: datetime.datetime
+
+
 class OrganizationCreateSerializer(BaseModel):
     name: str
 
@@ -58,6 +68,14 @@ class OrganizationSerializer(BaseModel):
     user_id: int
 
 
+class OrganizationDailyStatsSerializer(BaseModel):
+    day: datetime.date
+    booked_minutes: int
+    appointment_count: int
+    peak_hour: int | None
+    peak_hour_minutes: int
+
+
 class UserOutSerializer(BaseModel):
     id: int
     username: str
@@ -78,10 +96,15 @@ class TokenSerializer(BaseModel):
         orm_mode = True
 
 
+class RefreshTokenSerializer(BaseModel):
+    refresh_token: str
+
+
 class TokenPayloadSerializer(BaseModel):
     sub: str = None
     exp: int
     username: str = None
+    jti: str = None
 
     class Config:
         orm_mode = True
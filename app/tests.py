@@ -1,10 +1,27 @@
+import datetime
+import json
+import os
+import time
+
 import pytest
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from .database import settings
 from .main import app
+from .routers import profiles
 from .dependencies import get_current_db
-from .models import Base
+from .models import Appointment, Base, OrganizationDailyStats, OrganizationHourlyStats, RevokedToken
+from .utils.profiling import profile_request
+from .utils.revocation import RevokedTokenCache
+from .utils.ratelimit import (
+    InMemoryTokenBucketBackend,
+    RedisTokenBucketBackend,
+    get_concurrency_limiter,
+    rate_limit_backend,
+)
+from .utils.stats import split_by_hour
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///test.db"
 
@@ -207,3 +224,339 @@ def test_create_user_invalid(test_db):
     )
 
     assert response.status_code == 422
+
+
+def test_split_by_hour():
+    start = datetime.datetime(2022, 1, 1, 23, 30)
+    end = datetime.datetime(2022, 1, 2, 1, 0)
+    assert list(split_by_hour(start, end)) == [
+        (datetime.date(2022, 1, 1), 23, 30),
+        (datetime.date(2022, 1, 2), 0, 60),
+    ]
+
+
+def test_organization_stats(test_db, test_user):
+    token = test_login_user(test_user)
+    headers = {"Authorization": f"Bearer {token}"}
+    organization_id = client.post("/organizations/", json={"name": "Stats Organization"}, headers=headers).json()["id"]
+    response = client.post(
+        "/appointments/",
+        json={"start": "2023-03-01T10:30:00", "end": "2023-03-01T12:00:00", "organization_id": organization_id},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    appointment_id = response.json()["id"]
+
+    response = client.get(f"/organizations/{organization_id}/stats",
+                          params={"start": "2023-03-01", "end": "2023-03-01"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == [{
+        "day": "2023-03-01",
+        "booked_minutes": 90,
+        "appointment_count": 1,
+        "peak_hour": 11,
+        "peak_hour_minutes": 60,
+    }]
+
+    client.delete(f"/appointments/{appointment_id}", headers=headers)
+    response = client.get(f"/organizations/{organization_id}/stats",
+                          params={"start": "2023-03-01", "end": "2023-03-01"}, headers=headers)
+    assert response.json() == []
+
+
+def test_refresh_token(test_user):
+    tokens = client.post("/users/login", data=test_user).json()
+    response = client.post("/users/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["refresh_token"] == tokens["refresh_token"]
+
+    response = client.get("/users/me", headers={"Authorization": f"Bearer {data['access_token']}"})
+    assert response.status_code == 200
+
+
+def test_refresh_token_invalid():
+    response = client.post("/users/refresh", json={"refresh_token": "invalid"})
+    assert response.status_code == 403
+
+
+def test_refresh_token_revoked(test_db, test_user):
+    tokens = client.post("/users/login", data=test_user).json()
+    response = client.post("/users/logout", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+
+    response = client.post("/users/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 403
+
+
+def test_profile_request(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_TOKEN", "secret")
+    monkeypatch.setattr(settings, "PROFILING_OUTPUT_DIR", str(tmp_path))
+    profiled_app = FastAPI()
+    profiled_app.middleware("http")(profile_request)
+    profiled_app.include_router(profiles.router)
+    profiled_client = TestClient(profiled_app)
+
+    assert profiled_client.get("/profiles/").status_code == 403
+    headers = {"X-Profile-Token": "secret"}
+    assert profiled_client.get("/profiles/", headers=headers).json() == []
+
+    profiled_client.get("/profiles/", headers=headers)
+    data = profiled_client.get("/profiles/", headers=headers).json()
+    assert len(data) >= 1
+    response = profiled_client.get(f"/profiles/{data[0]['name']}", headers=headers)
+    assert response.status_code == 200
+    assert profiled_client.get("/profiles/missing.html", headers=headers).status_code == 404
+
+
+def test_profile_retention(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_TOKEN", "secret")
+    monkeypatch.setattr(settings, "PROFILING_OUTPUT_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "PROFILING_MAX_FILES", 2)
+    profiled_app = FastAPI()
+    profiled_app.middleware("http")(profile_request)
+    profiled_app.include_router(profiles.router)
+    profiled_client = TestClient(profiled_app)
+
+    for _ in range(4):
+        profiled_client.get("/profiles/", headers={"X-Profile-Token": "secret"})
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_read_calendar(test_db, test_user):
+    token = test_login_user(test_user)
+    headers = {"Authorization": f"Bearer {token}"}
+    first_id = client.post("/organizations/", json={"name": "First"}, headers=headers).json()["id"]
+    second_id = client.post("/organizations/", json={"name": "Second"}, headers=headers).json()["id"]
+    for organization_id, start, end in [
+        (first_id, "2023-04-01T09:00:00", "2023-04-01T10:00:00"),
+        (second_id, "2023-04-01T09:30:00", "2023-04-01T10:30:00"),
+        (first_id, "2023-04-01T12:00:00", "2023-04-01T13:00:00"),
+    ]:
+        client.post("/appointments/", json={"start": start, "end": end, "organization_id": organization_id},
+                    headers=headers)
+
+    response = client.get(
+        "/organizations/calendar",
+        params={"organization_ids": [first_id, second_id], "start": "2023-04-01T08:00:00",
+                "end": "2023-04-01T14:00:00", "free_time": True},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    entries = [json.loads(line) for line in response.text.splitlines()]
+    assert [(entry["type"], entry["start"], entry["end"]) for entry in entries] == [
+        ("free", "2023-04-01T08:00:00", "2023-04-01T09:00:00"),
+        ("appointment", "2023-04-01T09:00:00", "2023-04-01T10:00:00"),
+        ("appointment", "2023-04-01T09:30:00", "2023-04-01T10:30:00"),
+        ("free", "2023-04-01T10:30:00", "2023-04-01T12:00:00"),
+        ("appointment", "2023-04-01T12:00:00", "2023-04-01T13:00:00"),
+        ("free", "2023-04-01T13:00:00", "2023-04-01T14:00:00"),
+    ]
+
+
+def test_read_calendar_organization_not_found(test_db, test_user):
+    token = test_login_user(test_user)
+    response = client.get(
+        "/organizations/calendar",
+        params={"organization_ids": [999], "start": "2023-04-01T08:00:00", "end": "2023-04-01T14:00:00"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 404
+
+
+def test_rate_limit(test_user, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_ROUTES", {"refresh": 2})
+    monkeypatch.setattr(rate_limit_backend, "_buckets", {})
+    tokens = client.post("/users/login", data=test_user).json()
+    for _ in range(2):
+        response = client.post("/users/refresh", json={"refresh_token": tokens["refresh_token"]})
+        assert response.status_code == 200
+
+    response = client.post("/users/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_limit_concurrency(test_user, monkeypatch):
+    monkeypatch.setattr(settings, "CONCURRENCY_LIMIT", 1)
+    limiter = get_concurrency_limiter("bcrypt")
+    assert limiter.acquire(settings.CONCURRENCY_LIMIT)
+    try:
+        response = client.post("/users/login", data=test_user)
+    finally:
+        limiter.release()
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(settings.CONCURRENCY_RETRY_AFTER_SECONDS)
+
+    response = client.post("/users/login", data=test_user)
+    assert response.status_code == 200
+
+
+def test_organization_stats_not_backfilled(test_db, test_user):
+    token = test_login_user(test_user)
+    headers = {"Authorization": f"Bearer {token}"}
+    organization_id = client.post("/organizations/", json={"name": "Unreconciled"}, headers=headers).json()["id"]
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    db = TestingSessionLocal()
+    appointment = Appointment(start=datetime.datetime(2023, 5, 1, 10), end=datetime.datetime(2023, 5, 1, 11),
+                              organization_id=organization_id, user_id=user_id)
+    db.add(appointment)
+    db.commit()
+    appointment_id = appointment.id
+    db.close()
+
+    response = client.delete(f"/appointments/{appointment_id}", headers=headers)
+    assert response.status_code == 200
+    response = client.get(f"/organizations/{organization_id}/stats",
+                          params={"start": "2023-05-01", "end": "2023-05-01"}, headers=headers)
+    assert response.json() == []
+
+
+def test_read_calendar_aware_window(test_db, test_user):
+    token = test_login_user(test_user)
+    headers = {"Authorization": f"Bearer {token}"}
+    organization_id = client.post("/organizations/", json={"name": "Aware"}, headers=headers).json()["id"]
+    client.post("/appointments/", json={"start": "2023-06-01T09:00:00", "end": "2023-06-01T10:00:00",
+                                        "organization_id": organization_id}, headers=headers)
+
+    response = client.get(
+        "/organizations/calendar",
+        params={"organization_ids": [organization_id], "start": "2023-06-01T10:00:00+02:00",
+                "end": "2023-06-01T11:00:00Z", "free_time": True},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    entries = [json.loads(line) for line in response.text.splitlines()]
+    assert [(entry["type"], entry["start"], entry["end"]) for entry in entries] == [
+        ("free", "2023-06-01T08:00:00", "2023-06-01T09:00:00"),
+        ("appointment", "2023-06-01T09:00:00", "2023-06-01T10:00:00"),
+        ("free", "2023-06-01T10:00:00", "2023-06-01T11:00:00"),
+    ]
+
+
+def test_rate_limit_evicts_full_buckets(monkeypatch):
+    backend = InMemoryTokenBucketBackend()
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    backend._swept_at = now[0]
+    assert backend.take("login:client:1", 1, 5) == 0
+    assert "login:client:1" in backend._buckets
+
+    now[0] += backend.SWEEP_INTERVAL_SECONDS
+    assert backend.take("login:client:2", 1, 5) == 0
+    assert list(backend._buckets) == ["login:client:2"]
+
+
+def test_rate_limit_client_header(test_user, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_ROUTES", {"refresh": 1})
+    monkeypatch.setattr(settings, "RATE_LIMIT_CLIENT_HEADER", "X-Forwarded-For")
+    monkeypatch.setattr(rate_limit_backend, "_buckets", {})
+    tokens = client.post("/users/login", data=test_user).json()
+    for address in ["10.0.0.1", "10.0.0.2"]:
+        response = client.post("/users/refresh", json={"refresh_token": tokens["refresh_token"]},
+                               headers={"X-Forwarded-For": f"spoofed, {address}"})
+        assert response.status_code == 200
+
+    response = client.post("/users/refresh", json={"refresh_token": tokens["refresh_token"]},
+                           headers={"X-Forwarded-For": "10.0.0.1"})
+    assert response.status_code == 429
+
+
+def test_delete_organization_with_stats(test_db, test_user):
+    token = test_login_user(test_user)
+    headers = {"Authorization": f"Bearer {token}"}
+    organization_id = client.post("/organizations/", json={"name": "Deleted"}, headers=headers).json()["id"]
+    appointment_id = client.post(
+        "/appointments/",
+        json={"start": "2023-07-01T10:00:00", "end": "2023-07-01T11:00:00", "organization_id": organization_id},
+        headers=headers,
+    ).json()["id"]
+    client.delete(f"/appointments/{appointment_id}", headers=headers)
+
+    response = client.delete(f"/organizations/{organization_id}", headers=headers)
+    assert response.status_code == 200
+    db = TestingSessionLocal()
+    assert db.query(OrganizationDailyStats).filter(OrganizationDailyStats.organization_id == organization_id).count() == 0
+    assert db.query(OrganizationHourlyStats).filter(
+        OrganizationHourlyStats.organization_id == organization_id).count() == 0
+    db.close()
+
+
+def test_update_appointment_moves_stats(test_db, test_user):
+    token = test_login_user(test_user)
+    headers = {"Authorization": f"Bearer {token}"}
+    organization_id = client.post("/organizations/", json={"name": "Moved"}, headers=headers).json()["id"]
+    appointment_id = client.post(
+        "/appointments/",
+        json={"start": "2023-08-01T10:00:00", "end": "2023-08-01T11:00:00", "organization_id": organization_id},
+        headers=headers,
+    ).json()["id"]
+
+    response = client.put(
+        f"/appointments/{appointment_id}",
+        json={"start": "2023-08-02T14:00:00", "end": "2023-08-02T15:30:00", "organization_id": organization_id},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["id"] == appointment_id
+    assert response.json()["start"] == "2023-08-02T14:00:00"
+
+    response = client.get(f"/organizations/{organization_id}/stats",
+                          params={"start": "2023-08-01", "end": "2023-08-02"}, headers=headers)
+    assert response.json() == [{
+        "day": "2023-08-02",
+        "booked_minutes": 90,
+        "appointment_count": 1,
+        "peak_hour": 14,
+        "peak_hour_minutes": 60,
+    }]
+    db = TestingSessionLocal()
+    assert db.query(OrganizationHourlyStats).filter(
+        (OrganizationHourlyStats.organization_id == organization_id) & (
+                OrganizationHourlyStats.day == datetime.date(2023, 8, 1))).one().booked_minutes == 0
+    db.close()
+
+
+def test_redis_rate_limit_backend_unavailable():
+    pytest.importorskip("redis")
+    backend = RedisTokenBucketBackend("redis://127.0.0.1:1/0")
+    assert backend.take("login:client:1", 1, 1) == 0
+    assert backend.take("login:client:1", 1, 1) > 0
+
+
+def test_revoked_token_cache_sync_keeps_local_revocations(test_db):
+    cache = RevokedTokenCache()
+    db = TestingSessionLocal()
+    query = db.query
+
+    class SnapshotThenRevoke:
+        def __init__(self, snapshot):
+            self.snapshot = snapshot
+
+        def all(self):
+            rows = self.snapshot.all()
+            revoke_db = TestingSessionLocal()
+            cache.revoke(revoke_db, "revoked-during-sync", datetime.datetime.utcnow())
+            revoke_db.close()
+            return rows
+
+    def revoke_during_snapshot(*entities):
+        if len(entities) == 1 and entities[0] is RevokedToken.jti:
+            return SnapshotThenRevoke(query(*entities))
+        return query(*entities)
+
+    db.query = revoke_during_snapshot
+    cache.sync(db)
+    db.close()
+    assert "revoked-during-sync" in cache
+
+
+def test_read_calendar_too_many_organizations(test_db, test_user, monkeypatch):
+    monkeypatch.setattr(settings, "CALENDAR_MAX_ORGANIZATIONS", 2)
+    token = test_login_user(test_user)
+    response = client.get(
+        "/organizations/calendar",
+        params={"organization_ids": [1, 2, 3], "start": "2023-04-01T08:00:00", "end": "2023-04-01T14:00:00"},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    assert response.status_code == 400
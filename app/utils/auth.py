@@ -1,5 +1,6 @@
 from passlib.context import CryptContext
 import os
+import uuid
 from datetime import datetime, timedelta
 from typing import Union, Any
 from jose import jwt
@@ -39,6 +40,6 @@ def create_refresh_token(subject: Union[str, Any], expires_delta: int = None) ->
     else:
         expires_delta = datetime.utcnow() + timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)
 
-    to_encode = {"exp": expires_delta, "sub": str(subject)}
+    to_encode = {"exp": expires_delta, "sub": str(subject), "jti": uuid.uuid4().hex}
     encoded_jwt = jwt.encode(to_encode, JWT_REFRESH_SECRET_KEY, ALGORITHM)
     return encoded_jwt
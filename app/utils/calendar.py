@@ -0,0 +1,45 @@
+import heapq
+from datetime import datetime, timezone
+from typing import Iterable, Iterator
+
+from sqlalchemy.orm import Session
+
+from ..models import Appointment
+
+CURSOR_BATCH_SIZE = 100
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    """Appointments are stored as naive UTC; convert aware datetimes so they compare with them."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def organization_cursor(db: Session, organization_id: int, start: datetime, end: datetime) -> Iterator[Appointment]:
+    """Stream an organization's appointments overlapping [start, end) in (start, id) order."""
+    return iter(db.query(Appointment).filter(
+        (Appointment.organization_id == organization_id) & (Appointment.end > start) & (Appointment.start < end)
+    ).order_by(Appointment.start, Appointment.id).yield_per(CURSOR_BATCH_SIZE))
+
+
+def merge_calendars(cursors: Iterable[Iterator[Appointment]]) -> Iterator[Appointment]:
+    """k-way merge of start-ordered cursors; holds one pending row per cursor."""
+    return heapq.merge(*cursors, key=lambda appointment: (appointment.start, appointment.id))
+
+
+def iter_calendar(db: Session, organization_ids: list[int], start: datetime, end: datetime,
+                  free_time: bool = False) -> Iterator[tuple]:
+    """
+    Yield ("appointment", appointment) in chronological order across organizations and,
+    when free_time is set, ("free", slot_start, slot_end) for gaps where none of them is booked.
+    """
+    cursors = [organization_cursor(db, organization_id, start, end) for organization_id in organization_ids]
+    busy_until = start
+    for appointment in merge_calendars(cursors):
+        if free_time and appointment.start > busy_until:
+            yield "free", busy_until, appointment.start
+        busy_until = max(busy_until, appointment.end)
+        yield "appointment", appointment
+    if free_time and busy_until < end:
+        yield "free", busy_until, end
@@ -0,0 +1,77 @@
+import hmac
+import os
+import random
+import re
+import threading
+import time
+import uuid
+
+from fastapi import Request
+from pyinstrument import Profiler
+from starlette.concurrency import run_in_threadpool
+
+from ..database import settings
+
+PROFILE_HEADER = "X-Profile-Token"
+
+# Profilers install a process-wide hook, so only one request can be profiled at a time
+_profiling_lock = threading.Lock()
+
+
+def is_authorized(token: str | None) -> bool:
+    return bool(settings.PROFILING_TOKEN) and token is not None and hmac.compare_digest(
+        token, settings.PROFILING_TOKEN
+    )
+
+
+def _should_profile(request: Request) -> bool:
+    if is_authorized(request.headers.get(PROFILE_HEADER)):
+        return True
+    return settings.PROFILING_SAMPLE_RATE > 0 and random.random() < settings.PROFILING_SAMPLE_RATE
+
+
+def _output_path(request: Request, extension: str) -> str:
+    os.makedirs(settings.PROFILING_OUTPUT_DIR, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", request.url.path).strip("_") or "root"
+    name = "{}-{}-{}-{}.{}".format(time.strftime("%Y%m%dT%H%M%S"), request.method.lower(), slug,
+                                   uuid.uuid4().hex[:8], extension)
+    return os.path.join(settings.PROFILING_OUTPUT_DIR, name)
+
+
+def list_profiles() -> list[str]:
+    """Saved profile names, newest first."""
+    if not os.path.isdir(settings.PROFILING_OUTPUT_DIR):
+        return []
+    return sorted((name for name in os.listdir(settings.PROFILING_OUTPUT_DIR) if name.endswith(".html")),
+                  reverse=True)
+
+
+def _save_profile(profiler: Profiler, path: str):
+    with open(path, "w") as f:
+        f.write(profiler.output_html())
+    for name in list_profiles()[settings.PROFILING_MAX_FILES:]:
+        try:
+            os.remove(os.path.join(settings.PROFILING_OUTPUT_DIR, name))
+        except FileNotFoundError:
+            pass
+
+
+async def profile_request(request: Request, call_next):
+    """
+    Run the request under the pyinstrument sampling profiler and save an HTML flamegraph,
+    keeping only the newest PROFILING_MAX_FILES profiles.
+    The profiler samples the whole event loop thread, so concurrent requests can show up in the output.
+    Requests arriving while another one is being profiled run unprofiled.
+    """
+    if not _should_profile(request) or not _profiling_lock.acquire(blocking=False):
+        return await call_next(request)
+    try:
+        profiler = Profiler(async_mode="disabled")
+        profiler.start()
+        try:
+            return await call_next(request)
+        finally:
+            profiler.stop()
+            await run_in_threadpool(_save_profile, profiler, _output_path(request, "html"))
+    finally:
+        _profiling_lock.release()
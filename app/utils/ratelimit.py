@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+
+from ..database import settings
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryTokenBucketBackend:
+    """Token buckets kept in this process; limits apply per worker."""
+
+    SWEEP_INTERVAL_SECONDS = 60
+
+    def __init__(self):
+        # key -> (tokens, updated_at, full_at)
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._swept_at = time.monotonic()
+
+    def _sweep(self, now: float):
+        # A bucket that has refilled completely behaves exactly like a missing one
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+        self._swept_at = now
+
+    def take(self, key: str, rate: float, capacity: int) -> float:
+        """Consume one token and return 0, or return the seconds until a token is available."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._swept_at >= self.SWEEP_INTERVAL_SECONDS:
+                self._sweep(now)
+            tokens, updated_at, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            retry_after = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                retry_after = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            return retry_after
+
+
+class RedisTokenBucketBackend:
+    """Token buckets shared by every worker through Redis."""
+
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated_at")
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated_at = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+    local retry_after = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        retry_after = (1 - tokens) / rate
+    end
+    redis.call("HSET", KEYS[1], "tokens", tokens, "updated_at", now)
+    redis.call("EXPIRE", KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(retry_after)
+    """
+
+    TIMEOUT_SECONDS = 0.25
+
+    def __init__(self, url: str):
+        self._client = redis.Redis.from_url(url, socket_timeout=self.TIMEOUT_SECONDS,
+                                            socket_connect_timeout=self.TIMEOUT_SECONDS)
+        self._take = self._client.register_script(self.SCRIPT)
+        # Used while Redis is unavailable so an outage degrades to per-worker limits instead of errors
+        self._fallback = InMemoryTokenBucketBackend()
+
+    def take(self, key: str, rate: float, capacity: int) -> float:
+        try:
+            return float(self._take(keys=["ratelimit:" + key], args=[rate, capacity, time.time()]))
+        except redis.RedisError:
+            logger.warning("Rate limit backend unavailable, using in-process buckets", exc_info=True)
+            return self._fallback.take(key, rate, capacity)
+
+
+class ConcurrencyLimiter:
+    """Non-blocking counter of in-flight requests; callers are rejected instead of queued."""
+
+    def __init__(self):
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, limit: int) -> bool:
+        with self._lock:
+            if self._active >= limit:
+                return False
+            self._active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+
+
+def _create_backend():
+    if settings.RATE_LIMIT_REDIS_URL:
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_REDIS_URL is set but the redis package is not installed")
+        return RedisTokenBucketBackend(settings.RATE_LIMIT_REDIS_URL)
+    return InMemoryTokenBucketBackend()
+
+
+rate_limit_backend = _create_backend()
+concurrency_limiters = {}
+
+
+def get_route_limit(route: str) -> int:
+    return settings.RATE_LIMIT_ROUTES.get(route, settings.RATE_LIMIT_PER_MINUTE)
+
+
+def take_token(route: str, key: str) -> float:
+    limit = get_route_limit(route)
+    return rate_limit_backend.take("{}:{}".format(route, key), limit / 60, limit)
+
+
+def get_concurrency_limiter(name: str) -> ConcurrencyLimiter:
+    return concurrency_limiters.setdefault(name, ConcurrencyLimiter())
@@ -0,0 +1,52 @@
+import threading
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models import RevokedToken
+
+
+class RevokedTokenCache:
+    """
+    In-memory set of revoked refresh token ids, mirrored from the revoked_tokens table.
+    Revocations made by this process are visible immediately; revocations made by other
+    processes become visible after the next sync.
+    """
+
+    def __init__(self):
+        self._jtis = set()
+        # jtis revoked locally while a sync is reading its snapshot, merged into that snapshot
+        self._recent = set()
+        # Guards only the in-memory sets; DB work is never done while holding it
+        self._lock = threading.Lock()
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._jtis
+
+    def sync(self, db: Session):
+        now = datetime.utcnow()
+        db.query(RevokedToken).filter(RevokedToken.expires_at < now).delete()
+        db.commit()
+        with self._lock:
+            self._recent = set()
+        jtis = {jti for (jti,) in db.query(RevokedToken.jti).all()}
+        with self._lock:
+            self._jtis = jtis | self._recent
+
+    def revoke(self, db: Session, jti: str, expires_at: datetime):
+        if jti in self._jtis:
+            return
+        if db.query(RevokedToken).filter(RevokedToken.jti == jti).first() is None:
+            db.add(RevokedToken(jti=jti, expires_at=expires_at))
+            try:
+                db.commit()
+            except IntegrityError:
+                # Revoked concurrently by another request
+                db.rollback()
+        with self._lock:
+            self._jtis.add(jti)
+            self._recent.add(jti)
+
+
+revoked_tokens = RevokedTokenCache()
@@ -0,0 +1,194 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Iterator, Tuple
+
+from sqlalchemy import func, select, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from ..models import Appointment, Organization, OrganizationDailyStats, OrganizationHourlyStats
+
+RECONCILE_LOCK_KEY = 4_826_017_342
+
+
+def split_by_hour(start: datetime, end: datetime) -> Iterator[Tuple[date, int, int]]:
+    """Yield (day, hour, minutes) buckets covered by the [start, end) interval."""
+    cursor = start
+    while cursor < end:
+        next_hour = cursor.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        segment_end = min(next_hour, end)
+        minutes = int((segment_end - cursor).total_seconds() // 60)
+        if minutes:
+            yield cursor.date(), cursor.hour, minutes
+        cursor = segment_end
+
+
+def _appointment_buckets(appointment: Appointment):
+    hourly = defaultdict(int)
+    daily_minutes = defaultdict(int)
+    for day, hour, minutes in split_by_hour(appointment.start, appointment.end):
+        hourly[(day, hour)] += minutes
+        daily_minutes[day] += minutes
+    return hourly, daily_minutes
+
+
+def _insert(db: Session, model):
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite_insert(model)
+    return postgresql_insert(model)
+
+
+def apply_appointment(db: Session, appointment: Appointment, sign: int = 1):
+    """
+    Add (sign=1) or remove (sign=-1) an appointment's contribution to the stats tables.
+    Changes are not committed so they share the caller's transaction.
+    """
+    organization_id = appointment.organization_id
+    # Shared lock: concurrent bookings proceed, a running reconciliation makes them wait
+    db.query(Organization.id).filter(Organization.id == organization_id).with_for_update(read=True).first()
+    hourly, daily_minutes = _appointment_buckets(appointment)
+    start_day = appointment.start.date()
+    daily_minutes.setdefault(start_day, 0)
+
+    for (day, hour), minutes in hourly.items():
+        if sign > 0:
+            statement = _insert(db, OrganizationHourlyStats).values(
+                organization_id=organization_id, day=day, hour=hour, booked_minutes=minutes
+            ).on_conflict_do_update(
+                index_elements=["organization_id", "day", "hour"],
+                set_={"booked_minutes": OrganizationHourlyStats.booked_minutes + minutes},
+            )
+        else:
+            # Buckets missing a row were never counted, so there is nothing to remove
+            statement = update(OrganizationHourlyStats).where(
+                (OrganizationHourlyStats.organization_id == organization_id) & (OrganizationHourlyStats.day == day) & (
+                        OrganizationHourlyStats.hour == hour)
+            ).values(booked_minutes=OrganizationHourlyStats.booked_minutes - minutes)
+        db.execute(statement)
+
+    for day, minutes in daily_minutes.items():
+        count = 1 if day == start_day else 0
+        if sign > 0:
+            statement = _insert(db, OrganizationDailyStats).values(
+                organization_id=organization_id, day=day, booked_minutes=minutes, appointment_count=count
+            ).on_conflict_do_update(
+                index_elements=["organization_id", "day"],
+                set_={
+                    "booked_minutes": OrganizationDailyStats.booked_minutes + minutes,
+                    "appointment_count": OrganizationDailyStats.appointment_count + count,
+                },
+            )
+        else:
+            statement = update(OrganizationDailyStats).where(
+                (OrganizationDailyStats.organization_id == organization_id) & (OrganizationDailyStats.day == day)
+            ).values(
+                booked_minutes=OrganizationDailyStats.booked_minutes - minutes,
+                appointment_count=OrganizationDailyStats.appointment_count - count,
+            )
+        db.execute(statement)
+
+
+def reconcile_organization_stats(db: Session, organization_id: int):
+    """Rebuild an organization's stats tables from its appointments."""
+    # Exclusive lock: waits for in-flight bookings to commit and blocks new ones until the rebuild commits
+    db.query(Organization.id).filter(Organization.id == organization_id).with_for_update().first()
+    hourly = defaultdict(int)
+    daily_minutes = defaultdict(int)
+    daily_count = defaultdict(int)
+    appointments = db.query(Appointment).filter(Appointment.organization_id == organization_id).yield_per(1000)
+    for appointment in appointments:
+        appointment_hourly, appointment_daily = _appointment_buckets(appointment)
+        for key, minutes in appointment_hourly.items():
+            hourly[key] += minutes
+        for day, minutes in appointment_daily.items():
+            daily_minutes[day] += minutes
+        daily_count[appointment.start.date()] += 1
+
+    db.query(OrganizationHourlyStats).filter(OrganizationHourlyStats.organization_id == organization_id).delete()
+    db.query(OrganizationDailyStats).filter(OrganizationDailyStats.organization_id == organization_id).delete()
+    db.add_all([
+        OrganizationHourlyStats(organization_id=organization_id, day=day, hour=hour, booked_minutes=minutes)
+        for (day, hour), minutes in hourly.items()
+    ])
+    db.add_all([
+        OrganizationDailyStats(organization_id=organization_id, day=day, booked_minutes=daily_minutes[day],
+                               appointment_count=daily_count[day])
+        for day in set(daily_minutes) | set(daily_count)
+    ])
+    db.commit()
+
+
+def delete_organization_stats(db: Session, organization_id: int):
+    """Remove an organization's stats rows; zeroed rows are kept otherwise and would block deleting it."""
+    db.query(OrganizationHourlyStats).filter(OrganizationHourlyStats.organization_id == organization_id).delete()
+    db.query(OrganizationDailyStats).filter(OrganizationDailyStats.organization_id == organization_id).delete()
+
+
+def reconcile_all_stats(db: Session):
+    for (organization_id,) in db.query(Organization.id).all():
+        reconcile_organization_stats(db, organization_id)
+
+
+class ReconciliationLeader:
+    """
+    Elects the one process that reconciles stats by holding a session-level Postgres advisory lock
+    on a dedicated connection. Other processes keep retrying so one takes over if the holder dies.
+    """
+
+    def __init__(self, engine: Engine):
+        self._engine = engine
+        self._connection = None
+
+    def acquire(self) -> bool:
+        if self._engine.dialect.name != "postgresql":
+            return True
+        if self._connection is not None:
+            try:
+                self._connection.execute(text("SELECT 1"))
+                self._connection.commit()
+                return True
+            except Exception:
+                self._connection.invalidate()
+                self._connection = None
+        connection = self._engine.connect()
+        acquired = connection.execute(select(func.pg_try_advisory_lock(RECONCILE_LOCK_KEY))).scalar()
+        connection.commit()
+        if acquired:
+            self._connection = connection
+        else:
+            connection.close()
+        return acquired
+
+
+def get_organization_stats(db: Session, organization_id: int, start_day: date, end_day: date) -> list:
+    """Read per-day stats for [start_day, end_day] from the summary tables."""
+    daily_rows = db.query(OrganizationDailyStats).filter(
+        (OrganizationDailyStats.organization_id == organization_id) & (OrganizationDailyStats.day >= start_day) & (
+                OrganizationDailyStats.day <= end_day)).order_by(OrganizationDailyStats.day).all()
+    hourly_rows = db.query(OrganizationHourlyStats).filter(
+        (OrganizationHourlyStats.organization_id == organization_id) & (OrganizationHourlyStats.day >= start_day) & (
+                OrganizationHourlyStats.day <= end_day)).order_by(OrganizationHourlyStats.day,
+                                                                  OrganizationHourlyStats.hour).all()
+
+    peaks = {}
+    for row in hourly_rows:
+        peak = peaks.get(row.day)
+        if row.booked_minutes > 0 and (peak is None or row.booked_minutes > peak[1]):
+            peaks[row.day] = (row.hour, row.booked_minutes)
+
+    stats = []
+    for row in daily_rows:
+        # Rows can drift below zero until the next reconciliation; never serve them as data
+        if row.booked_minutes <= 0 and row.appointment_count <= 0:
+            continue
+        peak_hour, peak_hour_minutes = peaks.get(row.day, (None, 0))
+        stats.append({
+            "day": row.day,
+            "booked_minutes": max(row.booked_minutes, 0),
+            "appointment_count": max(row.appointment_count, 0),
+            "peak_hour": peak_hour,
+            "peak_hour_minutes": peak_hour_minutes,
+        })
+    return stats